@@ -3,27 +3,106 @@ Binary Search Tree: A sorted collection of values that supports
 efficient insertion, deletion, and minimum/maximum value finding.
 """
 
+import warnings
+from bisect import bisect_left
+
 # IMPLEMENTATION NOTES:
 #
-# Internally, we represent tree nodes using Python lists.  These lists
-# may either be empty (for empty nodes) or may have length four (for
-# non-empty nodes).  The non-empty nodes contain:
+# Internally, the tree is stored as a node arena: a set of parallel
+# lists (one per node field) that are indexed by an integer node id.
+# For the node with id i:
+#
+#     _left[i], _right[i]   -- the ids of its children
+#     _key[i]               -- its sort key
+#     _value[i]             -- its value
 #
-#     [left_child, right_child, value, sort_key]
+# A missing child (or an empty tree's root) is encoded as _EMPTY.
+# Keeping each field in its own list means that a descent only
+# touches the _left/_right/_key lists, and that inserting a value
+# doesn't allocate any new node objects.  Slots released by deletion
+# are pushed onto a free list, and are reused by later insertions.
 #
-# Using lists rather than a node class more than doubles the overall
-# performance in the benchmarks that I have run.
+# We use plain Python lists rather than typed (array/NumPy) arrays:
+# sort keys may be arbitrary comparable objects, and indexing a list
+# returns the stored int object rather than boxing a fresh one.
 #
-# The sort key is always accessed as node[-1].  This allows us to
-# optimize the case where the sort key is identical to the value, by
-# encoding such nodes as simply:
+# When a value is its own sort key, _key[i] is simply the value
+# itself, so that case costs one extra reference per node.
 #
-#     [left_child, right_child, value]
+# The tree is not kept balanced by rotations on every update.  Instead,
+# whenever an insertion lands deeper than twice log2 of the tree's size
+# (as happens with sorted input), we rebuild the subtree rooted at its
+# "scapegoat": the lowest ancestor on the insertion path with more than
+# 2/3 of its nodes on one side (see _rebuild_scapegoat).  Such a subtree
+# took a number of insertions proportional to its size to unbalance, so
+# the rebuilds cost O(log N) amortized per insertion.  rebalance() can
+# also be called to rebalance the whole tree at once.
 #
-_LEFT = 0
-_RIGHT = 1
-_VALUE = 2
-_SORT_KEY = -1
+# A BST that is built once and then only queried can be frozen (see
+# BinarySearchTree.freeze), which snapshots its keys and values into
+# two sorted lists.  While _frozen_keys is not None, the lookup methods
+# bisect those lists instead of walking the tree, and the first
+# insertion or deletion drops them again (see _thaw).
+#
+_EMPTY = -1
+
+#/////////////////////////////////////////////////////////////////////
+# Descent Kernels
+#/////////////////////////////////////////////////////////////////////
+# The inner loops of insert() and pop() are kept in plain functions
+# over the arena lists (rather than methods), so that each descent is
+# a single call whose loop only touches local variables.  Their
+# trailing `_EMPTY=_EMPTY` arguments (also used by the loop-heavy
+# methods below) turn the per-iteration global lookup of _EMPTY into a
+# local one; callers never pass them.
+
+def _descend_insert(left, right, keys, root, sort_key, _EMPTY=_EMPTY):
+    """
+    Walk down from `root` to the empty link where a node with the
+    given sort key belongs.  Return a (parent, link, depth) tuple,
+    where `link` is the list (`left` or `right`) holding parent's empty
+    child link, and `depth` is the number of nodes passed on the way;
+    parent is _EMPTY if the tree is empty.
+    """
+    parent = _EMPTY
+    link = left
+    node = root
+    depth = 0
+    while node != _EMPTY:
+        parent = node
+        if sort_key < keys[node]:
+            link = left
+        else:
+            link = right
+        node = link[node]
+        depth += 1
+    return parent, link, depth
+
+def _descend_find(left, right, keys, root, sort_key, _EMPTY=_EMPTY):
+    """
+    Walk down from `root` looking for a node with the given sort key.
+    Return a (parent, node) tuple; node is _EMPTY if no such node
+    exists.
+    """
+    # This makes up to two comparisons per level, but stops as soon as
+    # it meets a match.  Making one '<' per level and checking a single
+    # remembered candidate at the bottom always walks to a leaf, which
+    # measured slower for float, str, tuple and Python-level keys alike.
+    # BinarySearchTree.find() has an inlined copy of this loop (minus
+    # the parent tracking); keep the two in sync.
+    parent = _EMPTY
+    node = root
+    while node != _EMPTY:
+        node_key = keys[node]
+        if sort_key < node_key:
+            parent = node
+            node = left[node]
+        elif sort_key > node_key:
+            parent = node
+            node = right[node]
+        else:
+            break
+    return parent, node
 
 class BinarySearchTree(object):
     """
@@ -38,15 +117,25 @@ class BinarySearchTree(object):
     values with the same key).  The ordering of equal values, or
     values with equal keys, is undefined.
     """
-    def __init__(self, sort_key=None):
+    def __init__(self, sort_key=None, initial_capacity=16):
         """
         Create a new empty BST.  If a sort key is specified, then it
         will be used to define the sort order for the BST.  If an
         explicit sort key is not specified, then each value is
-        considered its own sort key.
+        considered its own sort key.  `initial_capacity` is the number
+        of nodes to reserve room for up front; the BST grows past it
+        as needed.
         """
-        self._root = [] # = empty node
+        self._root = _EMPTY
+        self._left = [_EMPTY] * initial_capacity
+        self._right = [_EMPTY] * initial_capacity
+        self._key = [None] * initial_capacity
+        self._value = [None] * initial_capacity
+        self._n = 0 # number of arena slots ever handed out.
+        self._free = [] # ids of arena slots released by deletion.
         self._sort_key = sort_key
+        self._frozen_keys = None # sorted keys, while frozen.
+        self._frozen_values = None # sorted values, while frozen.
         self._len = 0 # keep track of how many items we contain.
 
     #/////////////////////////////////////////////////////////////////
@@ -57,24 +146,83 @@ class BinarySearchTree(object):
         """
         Insert the specified value into the BST.
         """
+        if self._frozen_keys is not None:
+            self._thaw()
         # Get the sort key for this value.
         if self._sort_key is None:
             sort_key = value
         else:
             sort_key = self._sort_key(value)
-        # Walk down the tree until we find an empty node.
-        node = self._root
-        while node:
-            if sort_key < node[_SORT_KEY]:
-                node = node[_LEFT]
-            else:
-                node = node[_RIGHT]
-        # Put the value in the empty node.
-        if sort_key is value:
-            node[:] = [[], [], value]
+        left = self._left
+        right = self._right
+        keys = self._key
+        # Walk down the tree until we find an empty link.
+        parent, link, depth = _descend_insert(left, right, keys, self._root,
+                                              sort_key)
+        # Put the value in a free slot, and hook it onto the tree.
+        node = self._alloc()
+        left[node] = right[node] = _EMPTY
+        keys[node] = sort_key
+        self._value[node] = value
+        if parent == _EMPTY:
+            self._root = node
         else:
-            node[:] = [[], [], value, sort_key]
+            link[parent] = node
         self._len += 1
+        if depth > 2 * self._len.bit_length():
+            self._rebuild_scapegoat(sort_key, node)
+
+    def insert_many(self, values):
+        """
+        Insert all of the given values into the BST.  This sorts the
+        new values and rebuilds the whole BST as a balanced tree, so
+        it takes O(N + M log M) time for M new values; for a handful
+        of values, insert() each of them instead.
+        """
+        if self._frozen_keys is not None:
+            self._thaw()
+        values = list(values)
+        if self._sort_key is None:
+            keys = values
+        else:
+            keys = [self._sort_key(value) for value in values]
+        # Prepend the current contents, which are already sorted, so
+        # that sorting only has to merge in the new run.  (Extending
+        # in place avoids building a third list for each concatenation.)
+        all_keys, all_values = self._sorted_items()
+        all_keys.extend(keys)
+        all_values.extend(values)
+        order = sorted(range(len(all_keys)), key=all_keys.__getitem__)
+        self._build([all_keys[i] for i in order],
+                    [all_values[i] for i in order])
+
+    def merge(self, other):
+        """
+        Insert all of the values from the BST `other` into this BST,
+        leaving `other` unchanged.  Since both BSTs are already sorted,
+        their contents are merged in a single linear pass, and this BST
+        is rebuilt as a balanced tree, in O(N + M) time.  (If `other`
+        uses a different sort key, its values are re-sorted first.)
+        """
+        if self._frozen_keys is not None:
+            self._thaw()
+        keys, values = self._sorted_items()
+        other_keys, other_values = other._sorted_items()
+        if other._sort_key is not self._sort_key:
+            # `other` is sorted by a different key; re-sort by ours.
+            if self._sort_key is None:
+                other_keys = other_values
+            else:
+                other_keys = [self._sort_key(value) for value in other_values]
+            order = sorted(range(len(other_keys)), key=other_keys.__getitem__)
+            other_keys = [other_keys[i] for i in order]
+            other_values = [other_values[i] for i in order]
+        # Sorting the concatenation only has to merge its two sorted
+        # runs, which the list sort does in a single linear pass.
+        keys.extend(other_keys)
+        values.extend(other_values)
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._build([keys[i] for i in order], [values[i] for i in order])
 
     def minimum(self):
         """
@@ -82,7 +230,11 @@ class BinarySearchTree(object):
         values have the same (minimum) sort key, then it is undefined
         which one will be returned.
         """
-        return self._extreme_node(_LEFT)[_VALUE]
+        if self._frozen_keys is not None:
+            if not self._frozen_values:
+                raise IndexError('Empty Binary Search Tree!')
+            return self._frozen_values[0]
+        return self._value[self._extreme_node(self._left)]
 
     def maximum(self):
         """
@@ -90,14 +242,39 @@ class BinarySearchTree(object):
         have the same (maximum) sort key, then it is undefined which one
         will be returned.
         """
-        return self._extreme_node(_RIGHT)[_VALUE]
+        if self._frozen_keys is not None:
+            if not self._frozen_values:
+                raise IndexError('Empty Binary Search Tree!')
+            return self._frozen_values[-1]
+        return self._value[self._extreme_node(self._right)]
 
-    def find(self, sort_key):
+    def find(self, sort_key, _EMPTY=_EMPTY):
         """
         Find a value with the given sort key, and return it.  If no such
         value is found, then raise a KeyError.
         """
-        return self._find(sort_key)[_VALUE]
+        if self._frozen_keys is not None:
+            keys = self._frozen_keys
+            i = bisect_left(keys, sort_key)
+            if i == len(keys) or sort_key < keys[i]:
+                raise KeyError("Key %r not found in BST" % sort_key)
+            return self._frozen_values[i]
+        # This is _descend_find() inlined, without the parent tracking
+        # that only pop() needs; find() is the hottest read path.  Keep
+        # the two loops in sync.
+        left = self._left
+        right = self._right
+        keys = self._key
+        node = self._root
+        while node != _EMPTY:
+            node_key = keys[node]
+            if sort_key < node_key:
+                node = left[node]
+            elif sort_key > node_key:
+                node = right[node]
+            else:
+                return self._value[node]
+        raise KeyError("Key %r not found in BST" % sort_key)
 
     def pop_min(self):
         """
@@ -105,7 +282,9 @@ class BinarySearchTree(object):
         from the BST.  If multiple values have the same (minimum) sort key,
         then it is undefined which one will be returned.
         """
-        return self._pop_node(self._extreme_node(_LEFT))
+        if self._frozen_keys is not None:
+            self._thaw()
+        return self._pop_extreme(self._left, self._right)
 
     def pop_max(self):
         """
@@ -113,7 +292,9 @@ class BinarySearchTree(object):
         from the BST.  If multiple values have the same (maximum) sort key,
         then it is undefined which one will be returned.
         """
-        return self._pop_node(self._extreme_node(_RIGHT))
+        if self._frozen_keys is not None:
+            self._thaw()
+        return self._pop_extreme(self._right, self._left)
 
     def pop(self, sort_key):
         """
@@ -122,23 +303,82 @@ class BinarySearchTree(object):
         undefined which one will be returned.  If no value has the
         specified sort key, then raise a KeyError.
         """
-        return self._pop_node(self._find(sort_key))
+        if self._frozen_keys is not None:
+            self._thaw()
+        return self._pop_node(*self._find(sort_key))
 
     def values(self, reverse=False):
         """Generate the values in this BST in sorted order."""
+        if self._frozen_keys is not None:
+            if reverse:
+                return reversed(self._frozen_values)
+            else:
+                return iter(self._frozen_values)
         if reverse:
-            return self._iter(_RIGHT, _LEFT)
+            return self._iter(self._right, self._left)
         else:
-            return self._iter(_LEFT, _RIGHT)
+            return self._iter(self._left, self._right)
     __iter__ = values
 
+    def rebalance(self):
+        """
+        Rebalance this BST in place, using the Day-Stout-Warren
+        algorithm: first rotate the tree into a "vine" (a linked list
+        through the right links), and then repeatedly left-rotate
+        every other node of the vine until the tree is balanced.  This
+        takes O(N) time and needs no extra memory.
+        """
+        if self._len < 3:
+            return
+        # A temporary pseudo-root, whose right child is the real root,
+        # saves special-casing rotations at the top of the tree.
+        pseudo = self._alloc()
+        left = self._left
+        right = self._right
+        left[pseudo] = _EMPTY
+        right[pseudo] = self._root
+        # Tree to vine: rotate right at each node with a left child.
+        tail = pseudo
+        rest = self._root
+        while rest != _EMPTY:
+            if left[rest] == _EMPTY:
+                tail = rest
+                rest = right[rest]
+            else:
+                child = left[rest]
+                left[rest] = right[child]
+                right[child] = rest
+                rest = child
+                right[tail] = child
+        # Vine to tree: the first pass places the leaves of the bottom
+        # (partial) level; each later pass halves the vine.
+        size = self._len
+        leaves = size + 1 - (1 << ((size + 1).bit_length() - 1))
+        self._compress(pseudo, leaves)
+        size -= leaves
+        while size > 1:
+            size //= 2
+            self._compress(pseudo, size)
+        self._root = right[pseudo]
+        self._release(pseudo)
+
+    def freeze(self):
+        """
+        Optimize this BST for lookups: snapshot its keys and values in
+        sorted order, and answer find(), minimum(), maximum() and
+        values() from that snapshot by binary search.  The BST is
+        unfrozen automatically by the next insertion or deletion.
+        """
+        self._frozen_keys, self._frozen_values = self._sorted_items()
+
     def __len__(self):
         """Return the number of items in this BST"""
         return self._len
 
-    def __nonzero__(self):
+    def __bool__(self):
         """Return true if this BST is not empty"""
         return self._len>0
+    __nonzero__ = __bool__ # Python 2
 
     def __repr__(self):
         return '<BST: (%s)>' % ', '.join('%r' % v for v in self)
@@ -149,10 +389,12 @@ class BinarySearchTree(object):
     def pprint(self, max_depth=10, frame=True, show_key=True):
         """
         Return a pretty-printed string representation of this binary
-        search tree.
+        search tree.  Only the top `max_depth` levels are shown, and
+        deeper subtrees appear as '- ...'; a negative `max_depth` shows
+        the whole tree.
         """
-        t,m,b = self._pprint(self._root, max_depth, show_key)
-        lines = t+[m]+b
+        lines, mid = self._pprint(self._root, max_depth, show_key)
+        lines = [_spaces(pad)+''.join(reversed(parts)) for pad, parts in lines]
         if frame:
             width = max(40, max(len(line) for line in lines))
             s = '+-'+'MIN'.rjust(width, '-')+'-+\n'
@@ -166,119 +408,395 @@ class BinarySearchTree(object):
     # Private Helper Methods
     #/////////////////////////////////////////////////////////////////
 
-    def _extreme_node(self, side):
+    def _thaw(self):
+        """
+        Undo freeze() by dropping the sorted snapshot.
         """
-        Return the leaf node found by descending the given side of the
-        BST (either _LEFT or _RIGHT).
+        self._frozen_keys = self._frozen_values = None
+
+    def _alloc(self):
         """
-        if not self._root:
+        Return the id of an unused arena slot: a slot from the free
+        list if there is one, otherwise the next never-used slot.
+        """
+        if self._free:
+            return self._free.pop()
+        node = self._n
+        if node == len(self._key):
+            self._grow()
+        self._n = node + 1
+        return node
+
+    def _release(self, node):
+        """
+        Return the given node's slot to the free list, dropping its
+        key & value references so they can be garbage collected.
+        """
+        self._key[node] = self._value[node] = None
+        self._free.append(node)
+
+    def _grow(self):
+        """
+        Double the arena's capacity.  The lists are extended in place,
+        so references held by a caller stay valid.
+        """
+        extra = len(self._key) or 16
+        self._left.extend([_EMPTY] * extra)
+        self._right.extend([_EMPTY] * extra)
+        self._key.extend([None] * extra)
+        self._value.extend([None] * extra)
+
+    def _extreme_node(self, side, _EMPTY=_EMPTY):
+        """
+        Return the id of the leaf node found by descending the given
+        side of the BST (either self._left or self._right).
+        """
+        if self._root == _EMPTY:
             raise IndexError('Empty Binary Search Tree!')
         node = self._root
         # Walk down the specified side of the tree.
-        while node[side]:
-            node = node[side]
+        while side[node] != _EMPTY:
+            node = side[node]
         return node
 
     def _find(self, sort_key):
         """
-        Return a node with the given sort key, or raise KeyError if not found.
+        Return a (parent, node) tuple for a node with the given sort
+        key, or raise KeyError if not found.
+        """
+        parent, node = _descend_find(self._left, self._right, self._key,
+                                     self._root, sort_key)
+        if node == _EMPTY:
+            raise KeyError("Key %r not found in BST" % sort_key)
+        return parent, node
+
+    def _pop_extreme(self, side, other, _EMPTY=_EMPTY):
+        """
+        Delete the leaf node found by descending the given side of the
+        BST, and return its value.  That node has no child on `side`,
+        so it is simply replaced by its child on `other` (if any).
         """
         node = self._root
-        while node:
-            node_key = node[_SORT_KEY]
-            if sort_key < node_key:
-                node = node[_LEFT]
-            elif sort_key > node_key:
-                node = node[_RIGHT]
-            else:
-                return node
-        raise KeyError("Key %r not found in BST" % sort_key)
+        if node == _EMPTY:
+            raise IndexError('Empty Binary Search Tree!')
+        child = side[node]
+        if child == _EMPTY:
+            self._root = other[node]
+        else:
+            # Walk down the specified side of the tree.
+            while side[child] != _EMPTY:
+                node = child
+                child = side[child]
+            side[node] = other[child]
+            node = child
+        value = self._value[node]
+        self._release(node)
+        self._len -= 1
+        return value
 
-    # Add pop-node here
-    def _pop_node(self, node):
-        """
-        Delete the given node, and return it's value
-        """
-        value = node[_VALUE]
-        if node[_LEFT]:
-            if node[_RIGHT]:
-                # This node has a left child and a right child; find
-                # the node's successor, and replace the node's value
-                # with its successor's value.  Then replace the
-                # sucessor with its right child (the sucessor is
-                # guaranteed not to have a left child).  Note: node
-                # and successor may not be the same length (3 vs 4)
-                # because of the key-equal-to-value optimization; so
-                # we have to be a little careful here.
-                successor = node[_RIGHT]
-                while successor[_LEFT]: successor = successor[_LEFT]
-                node[2:] = successor[2:] # copy value & key
-                successor[:] = successor[_RIGHT]
-            else:
-                node[:] = node[_LEFT]
+    def _pop_node(self, parent, node):
+        """
+        Delete the given node (whose parent is `parent`), and return
+        it's value
+        """
+        left = self._left
+        right = self._right
+        value = self._value[node]
+        if left[node] != _EMPTY and right[node] != _EMPTY:
+            # This node has a left child and a right child; find the
+            # node's successor, and move the successor's value & key
+            # into this node.  Then replace the successor with its
+            # right child (the successor is guaranteed not to have a
+            # left child), and release the successor's slot.
+            parent = node
+            successor = right[node]
+            while left[successor] != _EMPTY:
+                parent = successor
+                successor = left[successor]
+            self._key[node] = self._key[successor]
+            self._value[node] = self._value[successor]
+            node = successor
+            child = right[successor]
+        elif left[node] != _EMPTY:
+            child = left[node]
         else:
-            if node[_RIGHT]:
-                node[:] = node[_RIGHT]
-            else:
-                del node[:]
+            child = right[node]
+        # Replace the link from parent to node with a link to child.
+        if parent == _EMPTY:
+            self._root = child
+        elif left[parent] == node:
+            left[parent] = child
+        else:
+            right[parent] = child
+        self._release(node)
         self._len -= 1
         return value
 
+    def _sorted_items(self):
+        """
+        Return a (keys, values) tuple of new lists holding this BST's
+        sort keys and values in sorted order.
+        """
+        if self._frozen_keys is not None:
+            return list(self._frozen_keys), list(self._frozen_values)
+        order = list(self._nodes(self._root, self._left, self._right))
+        return ([self._key[node] for node in order],
+                [self._value[node] for node in order])
+
+    def _build(self, keys, values):
+        """
+        Replace the contents of this BST with a balanced tree holding
+        the given values, whose sort keys `keys` are in sorted order.
+        The middle value of each range becomes that subtree's root.
+        Node ids follow the sorted order, so the two lists are used
+        as the new arena's key & value lists as they are.
+        """
+        n = len(keys)
+        self._left = [_EMPTY] * n
+        self._right = [_EMPTY] * n
+        self._key = keys
+        self._value = values
+        self._root = self._link_balanced(range(n))
+        self._n = self._len = n
+        self._free = []
 
+    def _link_balanced(self, nodes, _EMPTY=_EMPTY):
+        """
+        Relink the given nodes, which are listed in sorted order, into
+        a balanced tree (the middle node of each range becomes that
+        subtree's root), and return the id of its root.
+        """
+        left = self._left
+        right = self._right
+        # Each entry is a (lo, hi) range of `nodes` whose middle node's
+        # children still have to be linked up.
+        stack = [(0, len(nodes))] if nodes else []
+        while stack:
+            lo, hi = stack.pop()
+            mid = (lo + hi) // 2
+            node = nodes[mid]
+            if lo < mid:
+                left[node] = nodes[(lo + mid) // 2]
+                stack.append((lo, mid))
+            else:
+                left[node] = _EMPTY
+            if mid + 1 < hi:
+                right[node] = nodes[(mid + 1 + hi) // 2]
+                stack.append((mid + 1, hi))
+            else:
+                right[node] = _EMPTY
+        return nodes[len(nodes) // 2] if nodes else _EMPTY
 
-    def _iter(self, pre, post):
+    def _rebuild_scapegoat(self, sort_key, node):
+        """
+        Called by insert() when the new node `node` (with sort key
+        `sort_key`) landed too deep: find the lowest ancestor of node
+        that has more than 2/3 of its subtree's nodes below one child,
+        and rebuild that ancestor's subtree as a balanced tree.
+        """
+        left = self._left
+        right = self._right
+        keys = self._key
+        # Retrace insert()'s descent to collect node's ancestors.
+        path = []
+        ancestor = self._root
+        while ancestor != node:
+            path.append(ancestor)
+            if sort_key < keys[ancestor]:
+                ancestor = left[ancestor]
+            else:
+                ancestor = right[ancestor]
+        # Climb back up, totalling subtree sizes as we go; only the
+        # sibling subtrees have to be counted.
+        child = node
+        size = 1
+        while path:
+            ancestor = path.pop()
+            if left[ancestor] == child:
+                sibling = right[ancestor]
+            else:
+                sibling = left[ancestor]
+            ancestor_size = size + 1 + self._count(sibling)
+            if 3 * size > 2 * ancestor_size:
+                break
+            child = ancestor
+            size = ancestor_size
+        else:
+            # A node this deep always has such an ancestor, but fall
+            # back to rebuilding the whole tree just in case.
+            path = []
+            ancestor = self._root
+        nodes = list(self._nodes(ancestor, left, right))
+        subtree = self._link_balanced(nodes)
+        if not path:
+            self._root = subtree
+        elif left[path[-1]] == ancestor:
+            left[path[-1]] = subtree
+        else:
+            right[path[-1]] = subtree
+
+    def _count(self, node):
+        """Return the number of nodes in the subtree rooted at `node`."""
+        count = 0
+        for _ in self._nodes(node, self._left, self._right):
+            count += 1
+        return count
+
+    def _compress(self, pseudo, count):
+        """
+        Helper for rebalance(): left-rotate `count` alternate nodes
+        along the right spine below `pseudo`.
+        """
+        left = self._left
+        right = self._right
+        scanner = pseudo
+        for _ in range(count):
+            child = right[scanner]
+            right[scanner] = right[child]
+            scanner = right[scanner]
+            right[child] = left[scanner]
+            left[scanner] = child
+
+    def _iter(self, pre, post, _EMPTY=_EMPTY):
         # Helper for sorted iterators.
-        #   - If (pre,post) = (_LEFT,_RIGHT), then this will generate items
+        #   - If (pre,post) = (_left,_right), then this will generate items
         #     in sorted order.
-        #   - If (pre,post) = (_RIGHT,_LEFT), then this will generate items
+        #   - If (pre,post) = (_right,_left), then this will generate items
         #     in reverse-sorted order.
         # We use an iterative implemenation (rather than the recursive one)
-        # for efficiency.
+        # for efficiency.  This is _nodes() yielding values directly,
+        # which is measurably faster than mapping over _nodes().
+        values = self._value
         stack = []
         node = self._root
-        while stack or node:
-            if node: # descending the tree
+        while stack or node != _EMPTY:
+            if node != _EMPTY: # descending the tree
+                stack.append(node)
+                node = pre[node]
+            else: # ascending the tree
+                node = stack.pop()
+                yield values[node]
+                node = post[node]
+
+    def _nodes(self, root, pre, post, _EMPTY=_EMPTY):
+        """
+        Generate the ids of the nodes in the subtree rooted at `root`,
+        in the order described for _iter(); keep the two in sync.
+        """
+        stack = []
+        node = root
+        while stack or node != _EMPTY:
+            if node != _EMPTY: # descending the tree
                 stack.append(node)
-                node = node[pre]
+                node = pre[node]
             else: # ascending the tree
                 node = stack.pop()
-                yield node[_VALUE]
-                node = node[post]
+                yield node
+                node = post[node]
 
-    def _pprint(self, node, max_depth, show_key, spacer=2):
+    def _pprint(self, root, max_depth, show_key, spacer=2,
+                _EMPTY=_EMPTY):
         """
-        Returns a (top_lines, mid_line, bot_lines) tuple,
+        Returns a (lines, mid) tuple, where lines[mid] is the root's
+        line.  Each line is a [pad, parts] list, standing for `pad`
+        spaces followed by the strings in `parts` in reverse order;
+        see _prefix_line.  pprint() turns them into strings.
         """
         if max_depth == 0:
-            return ([], '- ...', [])
-        elif not node:
-            return ([], '- EMPTY', [])
-        else:
-            top_lines = []
-            bot_lines = []
-            mid_line = '-%r' % node[_VALUE]
-            if len(node) > 3: mid_line += ' (key=%r)' % node[_SORT_KEY]
-            if node[_LEFT]:
-                t,m,b = self._pprint(node[_LEFT], max_depth-1,
-                                     show_key, spacer)
-                indent = ' '*(len(b)+spacer)
-                top_lines += [indent+' '+line for line in t]
-                top_lines.append(indent+'/'+m)
-                top_lines += [' '*(len(b)-i+spacer-1)+'/'+' '*(i+1)+line
-                              for (i, line) in enumerate(b)]
-            if node[_RIGHT]:
-                t,m,b = self._pprint(node[_RIGHT], max_depth-1,
-                                     show_key, spacer)
-                indent = ' '*(len(t)+spacer)
-                bot_lines += [' '*(i+spacer)+'\\'+' '*(len(t)-i)+line
-                              for (i, line) in enumerate(t)]
-                bot_lines.append(indent+'\\'+m)
-                bot_lines += [indent+' '+line for line in b]
-            return (top_lines, mid_line, bot_lines)
+            return [[0, ['- ...']]], 0
+        elif root == _EMPTY:
+            return [[0, ['- EMPTY']]], 0
+        # We walk the tree in post-order with an explicit stack (rather
+        # than recursing), so each node is laid out once both of its
+        # subtrees have been.  Finished subtrees wait on `done`.  The
+        # children of nodes at the depth limit are never visited: they
+        # are shown as '- ...' directly.  (A negative max_depth counts
+        # down without ever reaching the limit.)
+        done = []
+        stack = [(root, max_depth, False)]
+        while stack:
+            node, depth, expanded = stack.pop()
+            left = self._left[node]
+            right = self._right[node]
+            if not expanded:
+                # Lay out the children first; left ends up below right
+                # on `done`.
+                stack.append((node, depth, True))
+                if depth != 1:
+                    if right != _EMPTY:
+                        stack.append((right, depth-1, False))
+                    if left != _EMPTY:
+                        stack.append((left, depth-1, False))
+                continue
+            value = self._value[node]
+            mid_line = '-%r' % value
+            if self._key[node] is not value:
+                mid_line += ' (key=%r)' % self._key[node]
+            lines = [[0, [mid_line]]]
+            mid = 0
+            if right != _EMPTY:
+                if depth != 1:
+                    bot_lines, m = done.pop()
+                else:
+                    bot_lines, m = [[0, ['- ...']]], 0
+                for i, line in enumerate(bot_lines):
+                    if i < m:
+                        _prefix_line(line, i+spacer, '\\', m-i)
+                    elif i == m:
+                        _prefix_line(line, m+spacer, '\\', 0)
+                    else:
+                        line[0] += m+spacer+1
+                lines += bot_lines
+            if left != _EMPTY:
+                if depth != 1:
+                    top_lines, m = done.pop()
+                else:
+                    top_lines, m = [[0, ['- ...']]], 0
+                n = len(top_lines)-m-1 # number of lines below m
+                for i, line in enumerate(top_lines):
+                    if i < m:
+                        line[0] += n+spacer+1
+                    elif i == m:
+                        _prefix_line(line, n+spacer, '/', 0)
+                    else:
+                        _prefix_line(line, n-(i-m-1)+spacer-1, '/', i-m)
+                lines = top_lines + lines
+                mid = len(top_lines)
+            done.append((lines, mid))
+        return done.pop()
 
-try:
+def _prefix_line(line, before, char, after):
+    """
+    Helper for _pprint: prefix the [pad, parts] line `line` with
+    `before` spaces, `char`, and `after` spaces.  Padding is only
+    counted until a non-space character has to go in front of it, so
+    each prefix costs O(1) rather than copying the whole line.
+    """
+    parts = line[1]
+    parts.append(_spaces(after+line[0]))
+    parts.append(char)
+    line[0] = before
 
+# Indentation strings for _pprint, so common widths are not rebuilt
+# for every line.
+_INDENTS = tuple(' '*i for i in range(128))
+
+def _spaces(n):
+    """Return a string of n spaces."""
+    if n < 128:
+        return _INDENTS[n]
+    return ' '*n
+
+# Optionally bind global constants into BinarySearchTree's methods.
+# Only a missing optimize_constants module is expected; if bind_all()
+# itself fails, warn rather than silently running unoptimized.
+try:
     from optimize_constants import bind_all
-    bind_all(BinarySearchTree)
-except:
-    pass
+except ImportError:
+    bind_all = None
+if bind_all is not None:
+    try:
+        bind_all(BinarySearchTree)
+    except Exception as e:
+        warnings.warn('optimize_constants.bind_all() failed: %s' % e,
+                      RuntimeWarning)
@@ -0,0 +1,342 @@
+"""
+Tests for race.BinarySearchTree.
+
+Most of these run random sequences of operations against both a
+BinarySearchTree and a plain sorted list of values (the "model"), and
+check that the two always agree.  Values are small ints, and most
+tests use a sort key that maps several values to the same key, so
+duplicate keys get exercised too.
+"""
+
+import gc
+import random
+import unittest
+import weakref
+
+from race import BinarySearchTree, _EMPTY
+
+def by_thirds(value):
+    return value // 3
+
+def height(bst):
+    """Return the number of levels in `bst`'s tree (0 if it's empty)."""
+    h = 0
+    level = [bst._root] if bst._root != _EMPTY else []
+    while level:
+        h += 1
+        level = [child for node in level
+                 for child in (bst._left[node], bst._right[node])
+                 if child != _EMPTY]
+    return h
+
+class BinarySearchTreeTest(unittest.TestCase):
+
+    #/////////////////////////////////////////////////////////////////
+    # Helpers
+    #/////////////////////////////////////////////////////////////////
+
+    def setUp(self):
+        self.rng = random.Random(1234)
+
+    def key_of(self, bst, value):
+        if bst._sort_key is None:
+            return value
+        return bst._sort_key(value)
+
+    def assertMatches(self, bst, model):
+        """
+        Check that `bst` holds exactly the values in `model` (a list
+        of values), and that its structure is a valid BST.
+        """
+        values = list(bst.values())
+        self.assertEqual(len(bst), len(model))
+        self.assertEqual(bool(bst), bool(model))
+        self.assertEqual(sorted(values), sorted(model))
+        keys = [self.key_of(bst, v) for v in values]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(list(bst.values(reverse=True)), values[::-1])
+        self.assertEqual(list(bst), values)
+        if model:
+            self.assertEqual(self.key_of(bst, bst.minimum()), keys[0])
+            self.assertEqual(self.key_of(bst, bst.maximum()), keys[-1])
+        if bst._frozen_keys is None:
+            self.assertTreeValid(bst)
+
+    def assertTreeValid(self, bst):
+        """
+        Check the arena: every live node is reachable exactly once
+        from the root, the stored keys match the values, and each
+        node's key lies within the bounds set by its ancestors.
+        """
+        seen = set()
+        stack = [(bst._root, None, None)] if bst._root != _EMPTY else []
+        while stack:
+            node, lo, hi = stack.pop()
+            self.assertNotIn(node, seen)
+            seen.add(node)
+            key = bst._key[node]
+            self.assertEqual(key, self.key_of(bst, bst._value[node]))
+            if lo is not None:
+                self.assertFalse(key < lo)
+            if hi is not None:
+                self.assertFalse(key > hi)
+            if bst._left[node] != _EMPTY:
+                stack.append((bst._left[node], lo, key))
+            if bst._right[node] != _EMPTY:
+                stack.append((bst._right[node], key, hi))
+        self.assertEqual(len(seen), len(bst))
+        self.assertFalse(seen & set(bst._free))
+        self.assertEqual(len(seen) + len(bst._free), bst._n)
+
+    def random_ops(self, bst, model, count, max_value=200):
+        """
+        Apply `count` random operations to both `bst` and `model`,
+        checking that they agree after each one.
+        """
+        rng = self.rng
+        for _ in range(count):
+            op = rng.random()
+            if op < 0.45 or not model:
+                value = rng.randrange(max_value)
+                bst.insert(value)
+                model.append(value)
+            elif op < 0.55:
+                value = bst.pop_min()
+                self.assertEqual(self.key_of(bst, value),
+                                 min(self.key_of(bst, v) for v in model))
+                model.remove(value)
+            elif op < 0.65:
+                value = bst.pop_max()
+                self.assertEqual(self.key_of(bst, value),
+                                 max(self.key_of(bst, v) for v in model))
+                model.remove(value)
+            elif op < 0.8:
+                key = self.key_of(bst, rng.choice(model))
+                value = bst.pop(key)
+                self.assertEqual(self.key_of(bst, value), key)
+                model.remove(value)
+            else:
+                key = self.key_of(bst, rng.randrange(max_value + 10))
+                if key in [self.key_of(bst, v) for v in model]:
+                    self.assertEqual(self.key_of(bst, bst.find(key)), key)
+                else:
+                    self.assertRaises(KeyError, bst.find, key)
+                    self.assertRaises(KeyError, bst.pop, key)
+            self.assertMatches(bst, model)
+
+    def assertPprints(self, bst, expected):
+        """
+        Check bst.pprint() against `expected`, which maps max_depth
+        values (None for the default) to the expected unframed lines.
+        The framed output must be the same lines in the usual frame.
+        """
+        for max_depth, lines in expected.items():
+            if max_depth is None:
+                kwargs = {}
+            else:
+                kwargs = {'max_depth': max_depth}
+            self.assertEqual(bst.pprint(frame=False, **kwargs),
+                             '\n'.join(lines))
+            width = max(40, max(len(line) for line in lines))
+            framed = ['+-' + 'MIN'.rjust(width, '-') + '-+']
+            framed += ['| %s |' % line.ljust(width) for line in lines]
+            framed += ['+-' + 'MAX'.rjust(width, '-') + '-+', '']
+            self.assertEqual(bst.pprint(**kwargs), '\n'.join(framed))
+
+    #/////////////////////////////////////////////////////////////////
+    # Tests
+    #/////////////////////////////////////////////////////////////////
+
+    def test_empty(self):
+        bst = BinarySearchTree()
+        self.assertMatches(bst, [])
+        self.assertRaises(KeyError, bst.find, 1)
+        self.assertRaises(KeyError, bst.pop, 1)
+        self.assertRaises(IndexError, bst.minimum)
+        self.assertRaises(IndexError, bst.maximum)
+        self.assertRaises(IndexError, bst.pop_min)
+        self.assertRaises(IndexError, bst.pop_max)
+
+    def test_random_ops(self):
+        for sort_key in (None, by_thirds):
+            bst = BinarySearchTree(sort_key=sort_key, initial_capacity=1)
+            model = []
+            self.random_ops(bst, model, 2000)
+            while model:
+                model.remove(bst.pop_min())
+                self.assertMatches(bst, model)
+
+    def test_sorted_inserts_stay_shallow(self):
+        for values in (range(3000), range(3000, 0, -1), [7] * 3000):
+            bst = BinarySearchTree()
+            for n, value in enumerate(values):
+                bst.insert(value)
+                self.assertTrue(height(bst) <= 2 * (n + 1).bit_length() + 1)
+            self.assertMatches(bst, list(values))
+
+    def test_rebalance(self):
+        for n in (0, 1, 2, 3, 7, 8, 100, 1000):
+            bst = BinarySearchTree(sort_key=by_thirds)
+            model = [self.rng.randrange(n * 2 + 1) for _ in range(n)]
+            for value in model:
+                bst.insert(value)
+            bst.rebalance()
+            self.assertEqual(height(bst), n.bit_length())
+            self.assertMatches(bst, model)
+            self.random_ops(bst, model, 100)
+
+    def test_insert_many(self):
+        bst = BinarySearchTree(sort_key=by_thirds)
+        model = []
+        self.random_ops(bst, model, 300)
+        more = [self.rng.randrange(300) for _ in range(500)]
+        bst.insert_many(more)
+        model.extend(more)
+        self.assertEqual(height(bst), len(model).bit_length())
+        self.assertMatches(bst, model)
+        self.random_ops(bst, model, 300)
+
+    def test_merge(self):
+        bst = BinarySearchTree(sort_key=by_thirds)
+        model = []
+        self.random_ops(bst, model, 300)
+        # The other tree's sort key is ignored; its values are re-keyed
+        # with this tree's.
+        other = BinarySearchTree(sort_key=lambda value: -value)
+        other_model = []
+        self.random_ops(other, other_model, 300)
+        bst.merge(other)
+        model.extend(other_model)
+        self.assertEqual(height(bst), len(model).bit_length())
+        self.assertMatches(bst, model)
+        self.assertMatches(other, other_model)
+        self.random_ops(bst, model, 300)
+        # Merging into an empty tree, and merging an empty tree.
+        empty = BinarySearchTree()
+        empty.merge(bst)
+        self.assertMatches(empty, model)
+        bst.merge(BinarySearchTree())
+        self.assertMatches(bst, model)
+
+    def test_freeze(self):
+        bst = BinarySearchTree(sort_key=by_thirds)
+        model = []
+        for _ in range(5):
+            self.random_ops(bst, model, 200)
+            bst.freeze()
+            self.assertMatches(bst, model)
+            for value in range(-5, 210):
+                key = by_thirds(value)
+                if key in [by_thirds(v) for v in model]:
+                    self.assertEqual(by_thirds(bst.find(key)), key)
+                else:
+                    self.assertRaises(KeyError, bst.find, key)
+            # Freezing twice is harmless; any mutation thaws the tree.
+            bst.freeze()
+            self.assertMatches(bst, model)
+        bst.freeze()
+        bst.rebalance()
+        self.assertMatches(bst, model)
+        bst.freeze()
+        bst.insert_many([1, 2, 3])
+        model.extend([1, 2, 3])
+        self.assertMatches(bst, model)
+
+    def test_subclass_overrides(self):
+        class LoggingTree(BinarySearchTree):
+            def insert(self, value):
+                self.inserted.append(value)
+                BinarySearchTree.insert(self, value)
+            def find(self, sort_key):
+                return ('found', BinarySearchTree.find(self, sort_key))
+        bst = LoggingTree()
+        bst.inserted = []
+        bst.insert(5)
+        bst.freeze()
+        self.assertEqual(bst.find(5), ('found', 5))
+        bst.insert(6)
+        self.assertEqual(bst.inserted, [5, 6])
+        self.assertEqual(bst.find(6), ('found', 6))
+
+    def test_freed_without_gc(self):
+        gc.disable()
+        try:
+            for freeze in (False, True):
+                bst = BinarySearchTree(sort_key=by_thirds)
+                for value in range(10):
+                    bst.insert(value)
+                if freeze:
+                    bst.freeze()
+                ref = weakref.ref(bst)
+                del bst
+                self.assertTrue(ref() is None)
+        finally:
+            gc.enable()
+
+    def test_pprint(self):
+        bst = BinarySearchTree()
+        for value in (5, 3, 8, 1, 4, 9):
+            bst.insert(value)
+        full = [r'      /-1',
+                r'   /-3',
+                r'  /   \-4',
+                r'-5',
+                r'  \-8',
+                r'     \-9']
+        self.assertPprints(bst, {
+            0: [r'- ...'],
+            1: [r'  /- ...',
+                r'-5',
+                r'  \- ...'],
+            2: [r'      /- ...',
+                r'   /-3',
+                r'  /   \- ...',
+                r'-5',
+                r'  \-8',
+                r'     \- ...'],
+            None: full,
+            -1: full})
+        self.assertPprints(BinarySearchTree(), {
+            None: [r'- EMPTY'],
+            0: [r'- ...']})
+
+    def test_pprint_keyed(self):
+        bst = BinarySearchTree(sort_key=by_thirds)
+        for value in (10, 4, 16, 1, 7):
+            bst.insert(value)
+        full = [r'      /-1 (key=0)',
+                r'   /-4 (key=1)',
+                r'  /   \-7 (key=2)',
+                r'-10 (key=3)',
+                r'  \-16 (key=5)']
+        self.assertPprints(bst, {
+            0: [r'- ...'],
+            1: [r'  /- ...',
+                r'-10 (key=3)',
+                r'  \- ...'],
+            2: [r'      /- ...',
+                r'   /-4 (key=1)',
+                r'  /   \- ...',
+                r'-10 (key=3)',
+                r'  \-16 (key=5)'],
+            None: full,
+            -1: full})
+
+    def test_pprint_frame(self):
+        bst = BinarySearchTree()
+        for value in (5, 3, 8, 1, 4, 9):
+            bst.insert(value)
+        self.assertEqual(bst.pprint(max_depth=2), '\n'.join([
+            r'+--------------------------------------MIN-+',
+            r'|       /- ...                             |',
+            r'|    /-3                                   |',
+            r'|   /   \- ...                             |',
+            r'| -5                                       |',
+            r'|   \-8                                    |',
+            r'|      \- ...                              |',
+            r'+--------------------------------------MAX-+',
+            r'']))
+
+
+if __name__ == '__main__':
+    unittest.main()